@@ -45,6 +45,14 @@ def create_server() -> FastMCP:
     return mcp
 
 def main() -> None:
+    # Prefer uvloop's faster event loop when installed (optional dependency)
+    try:
+        import uvloop
+        uvloop.install()
+        logger.info("uvloop event loop installed")
+    except ImportError:
+        pass
+
     server = create_server()
     server.run(transport="streamable-http")
 
@@ -7,10 +7,7 @@ import secrets
 import logging
 from typing import Optional
 
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import JSONResponse
-from starlette.requests import Request as StarletteRequest
 from starlette.applications import Starlette
 from mcp.server.fastmcp import FastMCP
 
@@ -46,6 +43,8 @@ class AuthConfig:
                 )
 
         self.api_key: str = raw_key
+        # Pre-encoded form for byte-wise comparison in the request hot path
+        self.api_key_bytes: bytes = raw_key.encode("utf-8")
         logger.info(
             "API key authentication enabled (env=%s, generated_dev=%s)",
             self.env,
@@ -55,40 +54,52 @@ class AuthConfig:
 auth_config = AuthConfig()
 
 
-def _extract_token_from_headers(request: Request) -> Optional[str]:
-    """Extract the API key from supported headers.
+def _extract_token_from_scope(scope) -> Optional[bytes]:
+    """Extract the API key from the raw ASGI header pairs.
 
     Priority order:
       1. Authorization: Bearer <token>
       2. X-API-Key: <token>
     """
-    auth_header = request.headers.get("Authorization")
-    if auth_header and auth_header.lower().startswith("bearer "):
-        return auth_header.split(" ", 1)[1].strip() or None
-    x_api_key = request.headers.get("X-API-Key")
-    if x_api_key:
+    auth_header = None
+    x_api_key = None
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization" and auth_header is None:
+            auth_header = value
+        elif name == b"x-api-key" and x_api_key is None:
+            x_api_key = value
+    if auth_header is not None and auth_header[:7].lower() == b"bearer ":
+        return auth_header[7:].strip() or None
+    if x_api_key is not None:
         return x_api_key.strip() or None
     return None
 
 
-class APIKeyAuthMiddleware(BaseHTTPMiddleware):
-    """Starlette/ASGI middleware enforcing API key authentication for /mcp paths.
+class APIKeyAuthMiddleware:
+    """Pure ASGI middleware enforcing API key authentication for /mcp paths.
+
+    Implemented as a raw ASGI callable rather than BaseHTTPMiddleware: the
+    latter spins up a response-streaming task per request, which is pure
+    overhead on this hot path. Header probing works byte-wise on the pairs
+    already present in the ASGI scope.
 
     Anything whose path starts with the PROTECTED_PREFIX requires a valid API key.
     Other paths (health, docs, root, etc.) are left open implicitly.
     """
 
     def __init__(self, app):
-        super().__init__(app)
+        self.app = app
 
-    async def dispatch(self, request: StarletteRequest, call_next):
-        if request.url.path.startswith(PROTECTED_PREFIX):
-            token = _extract_token_from_headers(request)
+    async def __call__(self, scope, receive, send):
+        if scope.get("type") == "http" and scope.get("path", "").startswith(PROTECTED_PREFIX):
+            token = _extract_token_from_scope(scope)
             if not token:
-                return JSONResponse({"detail": "Authorization or X-API-Key header required"}, status_code=401, headers={"WWW-Authenticate": "Bearer"})
-            if not secrets.compare_digest(token, auth_config.api_key):
-                return JSONResponse({"detail": "Invalid API key"}, status_code=401, headers={"WWW-Authenticate": "Bearer"})
-        return await call_next(request)
+                response = JSONResponse({"detail": "Authorization or X-API-Key header required"}, status_code=401, headers={"WWW-Authenticate": "Bearer"})
+                return await response(scope, receive, send)
+            if not secrets.compare_digest(token, auth_config.api_key_bytes):
+                response = JSONResponse({"detail": "Invalid API key"}, status_code=401, headers={"WWW-Authenticate": "Bearer"})
+                return await response(scope, receive, send)
+        return await self.app(scope, receive, send)
 
 
 class APIKeyFastMCP(FastMCP):
@@ -4,20 +4,51 @@ MCP tools for Object Detection.
 
 import logging
 import os, sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional, Annotated, Literal
 from pydantic import Field
 
 from mcp.server.fastmcp import FastMCP
 
-from src.inference import run as run_inference
+from src.inference import run as run_inference, _load_model as load_model
 from src import processors
-import shutil
 
 from .data_models.output import DetectObjectsOutput
 
 logger = logging.getLogger(__name__)
 
+# Result cache for repeat (url, object_type) queries: bounded LRU with a TTL,
+# so identical questions within a session skip download + inference entirely
+_RESULT_CACHE_MAX = 128
+_RESULT_CACHE_TTL_SECONDS = 15 * 60
+_result_cache = OrderedDict()
+_result_cache_lock = threading.Lock()
+
+
+def _result_cache_get(key):
+    with _result_cache_lock:
+        entry = _result_cache.get(key)
+        if entry is None:
+            return None
+        timestamp, value = entry
+        if time.monotonic() - timestamp > _RESULT_CACHE_TTL_SECONDS:
+            del _result_cache[key]
+            return None
+        _result_cache.move_to_end(key)
+        return value
+
+
+def _result_cache_put(key, value) -> None:
+    with _result_cache_lock:
+        _result_cache[key] = (time.monotonic(), value)
+        _result_cache.move_to_end(key)
+        while len(_result_cache) > _RESULT_CACHE_MAX:
+            _result_cache.popitem(last=False)
+
 
 def validate_auth() -> None:
     """Simple auth validation - just checks if we're in production without API key."""
@@ -70,55 +101,81 @@ def register_tools(mcp: FastMCP) -> None:
         if object_type not in ACCEPTED_OBJECT_TYPES:
             raise ValueError(f"Invalid object_type '{object_type}'. Must be one of {ACCEPTED_OBJECT_TYPES}")
 
+        cache_key = (url, object_type)
+        cached = _result_cache_get(cache_key)
+        if cached is not None:
+            logger.info(f"Returning cached detection result for object_type '{object_type}'")
+            return cached
+
         # Update settings based on object type:
         downsample_factor = 6 if object_type == 'ship' else 2 #6 for ship, 2 for airplanes
 
-        # Run preprocessor
+        # Run preprocessor in a worker thread and warm the model meanwhile, so
+        # a cold server overlaps the I/O-bound download/decode with the
+        # CPU-bound weight load instead of paying them back-to-back
         try:
-            pre = processors.preprocess_image(url, max_side_size=512, force_download=False, downsample_factor=downsample_factor)
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                pre_future = executor.submit(
+                    processors.preprocess_image, url, max_side_size=512,
+                    force_download=False, downsample_factor=downsample_factor,
+                )
+                try:
+                    load_model(WEIGHTS)
+                except Exception:
+                    # A load problem will resurface from run_inference below
+                    pass
+                pre = pre_future.result()
         except Exception as e:
             logger.error(f"Preprocessing failed: {e}")
             raise RuntimeError(f"Preprocessing failed: {e}") from e
 
         chips = pre['chips']
         chip_boxes = pre['chip_boxes']
-        temp_dir = pre.get('temp_dir')
 
         all_detections = []
 
-        # Run inference sequentially on each chip
-        for idx, chip in enumerate(chips):
-            logger.info(f"Processing chip {idx + 1}/{len(chips)} at original position {chip_boxes[idx]}")
-            detections = run_inference(weights=WEIGHTS, image_input=chip, confidence_threshold=0.2)
+        # Run inference on all chips in one batched forward pass; the
+        # preprocessor guarantees uniform chip sizes, so the model can stack
+        # them into a single (N,3,H,W) tensor
+        if len({chip.shape for chip in chips}) > 1:
+            # Ragged chip sizes can't be stacked directly; pack them into one
+            # zero-padded batch array so they still go through a single
+            # forward pass. Padding sits bottom/right, so chip-local
+            # detection coordinates are unaffected.
+            logger.info(f"Chip sizes differ; padding {len(chips)} chips into one batch")
+            batch = processors.pad_chips_to_batch(chips)
+            batch_detections = run_inference(weights=WEIGHTS, image_input=list(batch), confidence_threshold=0.2)
+        else:
+            logger.info(f"Running batched inference on {len(chips)} chips")
+            batch_detections = run_inference(weights=WEIGHTS, image_input=chips, confidence_threshold=0.2)
+        for idx, detections in enumerate(batch_detections):
             for det in detections:
                 det['_chip_index'] = idx
                 det['_chip_box'] = chip_boxes[idx]
             all_detections.extend(detections)
 
+        # Only the requested class is ever counted, so drop other detections
+        # before NMS; IoU work is quadratic in the number of boxes
+        all_detections = [d for d in all_detections if d.get('name') == object_type]
+
         # Post-process detections: aggregate, NMS
         aggregated = processors.postprocess_detections(
             all_detections, chips, chip_boxes, pre['original_size'], pre['padded_size'], annotate_chips=False, output_path=None
         )
         logger.info(f"Post-processed detections (after NMS): {len(aggregated)} entries")
 
-        # Count objects by type
-        num_objects = 0
-        for det in aggregated:
-            label = det.get('name')
-            if label in object_type:
-                num_objects += 1
+        # Count objects of the requested type (exact match: the old substring
+        # test would let e.g. 'ship' match inside 'battleship')
+        num_objects = sum(1 for det in aggregated if det.get('name') == object_type)
         found_objects = {object_type: num_objects}
         logger.info(f"Detected objects: {found_objects}")
-        
-        # Clean up temporary directory if images were downloaded
-        if temp_dir is not None and os.path.isdir(temp_dir):
-            try:
-                shutil.rmtree(temp_dir)
-                logger.info(f"Cleaned up temporary directory: {temp_dir}")
-            except Exception as e:
-                logger.warning(f"Failed to clean up temporary directory {temp_dir}: {e}")
-
-        return DetectObjectsOutput(found_objects=found_objects)
+
+        # Downloads live in processors' persistent URL-keyed cache now, so
+        # there is no temporary directory to clean up
+
+        output = DetectObjectsOutput(found_objects=found_objects)
+        _result_cache_put(cache_key, output)
+        return output
 
 
 
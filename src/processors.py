@@ -1,20 +1,47 @@
+import hashlib
 import io
 import os
 import tempfile
-import shutil
+import time
 import math
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
 
 from PIL import Image, ImageDraw, ImageFont
 
 # Prefer requests if available for nicer handling, but fall back to urllib
 import requests
+from requests.adapters import HTTPAdapter
 
 import rasterio  # type: ignore
 from rasterio.io import MemoryFile  # type: ignore
 from rasterio.warp import transform_bounds  # type: ignore
 
+# OpenCV decodes JPEG/PNG with SIMD and is measurably faster than Pillow, but
+# it needs system libs (e.g. libGL) that headless environments may lack, so
+# treat it as optional and fall back to Pillow
+try:
+    import cv2  # type: ignore
+except Exception:
+    cv2 = None
+
+# Numba JIT-compiles the NMS hot loop to native code when available; the
+# NumPy implementation remains the fallback
+try:
+    import numba  # type: ignore
+except Exception:
+    numba = None
+
+# torchvision's fused C++/CUDA NMS kernel beats both Python-side paths; it is
+# available wherever ultralytics is installed but stays optional here
+try:
+    import torch as _torch  # type: ignore
+    from torchvision.ops import nms as _torchvision_nms  # type: ignore
+except Exception:
+    _torch = None
+    _torchvision_nms = None
+
 
 import numpy as np
 
@@ -23,16 +50,168 @@ def is_url(path: str) -> bool:
     return isinstance(path, str) and (path.startswith('http://') or path.startswith('https://'))
 
 
+# Shared HTTP session so downloads reuse pooled TCP connections instead of
+# paying a fresh handshake per request
+_http_session = None
+
+
+def _get_http_session() -> requests.Session:
+    global _http_session
+    if _http_session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=8)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _http_session = session
+    return _http_session
+
+
+# Persistent download cache shared across requests/processes: entries are
+# keyed by the URL hash, considered fresh for an hour, pruned oldest-first
+# past the size bound
+_DOWNLOAD_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'sat-detect')
+_DOWNLOAD_CACHE_TTL_SECONDS = 60 * 60
+_DOWNLOAD_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+
+def _prune_download_cache() -> None:
+    entries = []
+    total = 0
+    try:
+        names = os.listdir(_DOWNLOAD_CACHE_DIR)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(_DOWNLOAD_CACHE_DIR, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+        total += st.st_size
+    if total <= _DOWNLOAD_CACHE_MAX_BYTES:
+        return
+    for mtime, size, path in sorted(entries):
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        if total <= _DOWNLOAD_CACHE_MAX_BYTES:
+            break
+
+
+def _cached_download(url: str) -> str:
+    """Download `url` into the content-addressed cache, reusing fresh entries.
+
+    Returns the local path of the cached file. A second request for the same
+    URL within the TTL is a pure filesystem hit.
+    """
+    os.makedirs(_DOWNLOAD_CACHE_DIR, exist_ok=True)
+    ext = os.path.splitext(urllib.request.urlparse(url).path)[1].lower()
+    cache_path = os.path.join(_DOWNLOAD_CACHE_DIR, hashlib.sha256(url.encode('utf-8')).hexdigest() + ext)
+    if os.path.exists(cache_path) and (time.time() - os.path.getmtime(cache_path)) < _DOWNLOAD_CACHE_TTL_SECONDS:
+        return cache_path
+
+    # Download to a unique temp file and rename atomically: readers never see
+    # a truncated entry, and concurrent downloads of the same URL each write
+    # their own file instead of interleaving into a shared .part (last rename
+    # wins with a complete copy either way)
+    fd, part_path = tempfile.mkstemp(dir=_DOWNLOAD_CACHE_DIR, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            with _get_http_session().get(url, stream=True, timeout=15) as r:
+                r.raise_for_status()
+                for chunk in r.iter_content(chunk_size=8192):
+                    if chunk:
+                        f.write(chunk)
+        os.replace(part_path, cache_path)
+    except Exception:
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+        raise
+    _prune_download_cache()
+    return cache_path
+
+
+def _load_rgb_array(path: str) -> np.ndarray:
+    """Decode a non-TIFF image file to a numpy array, preferring OpenCV.
+
+    Both decoders produce the same uint8 RGB pixels; OpenCV is just faster.
+    """
+    if cv2 is not None:
+        bgr = cv2.imread(path, cv2.IMREAD_COLOR)
+        if bgr is not None:
+            return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+    return np.array(Image.open(path))
+
+
+def _read_tiff_hwc(ds, window=None, block_rows: int = 2048) -> np.ndarray:
+    """Read up to the first three bands of a rasterio dataset into an HWC array.
+
+    Reads proceed strip-by-strip into a preallocated array, so peak memory is
+    the HWC result plus one strip, rather than the full CHW raster at source
+    bit depth followed by a transposed copy. Unused bands (e.g. NIR in 4-band
+    NAIP) are never decoded.
+    """
+    if window is not None:
+        col_off = int(window.col_off)
+        row_off = int(window.row_off)
+        width = int(window.width)
+        height = int(window.height)
+    else:
+        col_off = row_off = 0
+        width, height = ds.width, ds.height
+
+    nbands = min(3, ds.count)
+    indexes = list(range(1, nbands + 1))
+    out = np.empty((height, width, nbands), dtype=np.dtype(ds.dtypes[0]))
+    for y0 in range(0, height, block_rows):
+        bh = min(block_rows, height - y0)
+        win = rasterio.windows.Window(col_off, row_off + y0, width, bh)
+        block = ds.read(indexes=indexes, window=win)
+        out[y0:y0 + bh, :, :] = np.transpose(block, (1, 2, 0))
+    return out
+
+
     # Removed unused helper functions _open_image_bytes and _read_image_from_url (previously handled URL streaming)
 
 
-def preprocess_image(input_path_or_url: str, max_side_size: int = 512, force_download: bool = False, downsample_factor: float = 1.0, bbox: Optional[List[float]] = None) -> Dict:
+def _build_preprocess_result(chips, chips_arr, chip_boxes, original_size, padded_size, temp_dir, downloaded_path, as_tensor) -> Dict:
+    """Assemble the `preprocess_image` result dict (and optional chip tensor)."""
+    chips_tensor = None
+    if as_tensor:
+        try:
+            import torch
+        except ImportError:
+            torch = None
+        if torch is not None:
+            # One contiguous NCHW tensor covering every chip; pinned memory lets
+            # the caller do a single async H2D copy instead of N separate ones
+            chips_tensor = torch.from_numpy(np.ascontiguousarray(chips_arr)).permute(0, 3, 1, 2).contiguous()
+            if torch.cuda.is_available():
+                chips_tensor = chips_tensor.pin_memory()
+
+    return {
+        'chips': chips,
+        'chip_boxes': chip_boxes,
+        'original_size': original_size,
+        'padded_size': padded_size,
+        'temp_dir': temp_dir,
+        'downloaded_path': downloaded_path,
+        'chips_tensor': chips_tensor,
+    }
+
+
+def preprocess_image(input_path_or_url: str, max_side_size: int = 512, force_download: bool = False, downsample_factor: float = 1.0, bbox: Optional[List[float]] = None, as_tensor: bool = False) -> Dict:
     """Preprocess an input image (local path or URL) and return a dict containing:
        - chips: list of numpy uint8 arrays (H, W, 3) of equal size
        - chip_boxes: list of (x_min,y_min,x_max,y_max) in ORIGINAL image pixel coordinates
        - original_size: (width, height)
        - padded_size: (padded_width, padded_height)
-       - temp_dir: path to temporary dir if a download occurred (caller should clean up)
+       - temp_dir: always None now that downloads persist in the URL cache (kept for back-compat)
 
     Args:
         input_path_or_url: Path to local image file or URL to download
@@ -40,6 +219,10 @@ def preprocess_image(input_path_or_url: str, max_side_size: int = 512, force_dow
         force_download: Force download for URLs instead of streaming (default False)
         downsample_factor: Factor to downsample image before processing (default 1.0 = no downsampling)
         bbox: Optional bounding box (west, south, east, north) to clip the image
+        as_tensor: Also build a single (N,3,H,W) uint8 torch tensor of all chips
+            (pinned when CUDA is available) under the 'chips_tensor' result key,
+            so callers can upload the whole batch to the GPU in one transfer.
+            Requires torch; ignored when torch is unavailable.
 
     The function ensures the returned chips are 8-bit RGB images and does not attempt
     to process images with more than 4 bands. If downsample_factor > 1.0, the image
@@ -55,18 +238,13 @@ def preprocess_image(input_path_or_url: str, max_side_size: int = 512, force_dow
         ext = os.path.splitext(url_path)[1].lower()
         is_tiff = ext in ('.tif', '.tiff')
 
-        if force_download and temp_dir is None:
-            temp_dir = tempfile.mkdtemp(prefix='preproc_')  
-            # Download to temp_dir if force_download is set
-            local_filename = os.path.join(temp_dir, os.path.basename(url_path))
+        if force_download:
+            # Downloads land in a persistent content-addressed cache keyed by
+            # the URL, so repeat requests skip the transfer. temp_dir stays
+            # None: cached files must outlive the caller, so there is nothing
+            # for it to clean up.
             try:
-                #download the file
-                with requests.get(input_path_or_url, stream=True, timeout=15) as r:
-                    r.raise_for_status()
-                    with open(local_filename, 'wb') as f:
-                        for chunk in r.iter_content(chunk_size=8192):
-                            if chunk:
-                                f.write(chunk)
+                local_filename = _cached_download(input_path_or_url)
             except Exception as e:
                 raise RuntimeError(f"Failed to download image from URL '{input_path_or_url}': {e}")
             downloaded_path = local_filename
@@ -74,7 +252,10 @@ def preprocess_image(input_path_or_url: str, max_side_size: int = 512, force_dow
         if is_tiff:
             tiff_path = local_filename if force_download else input_path_or_url
             try:
-                with rasterio.open(tiff_path) as ds:
+                # Let GDAL decode COG tiles with all cores and restrict remote
+                # range-reads to tiff extensions
+                gdal_env = rasterio.Env(GDAL_NUM_THREADS='ALL_CPUS', CPL_VSIL_CURL_ALLOWED_EXTENSIONS='.tif,.tiff')
+                with gdal_env, rasterio.open(tiff_path) as ds:
                     if bbox is not None:
                         # Validate bbox input (expects WGS84 lon/lat)
                         if not (isinstance(bbox, (list, tuple)) and len(bbox) == 4):
@@ -103,9 +284,9 @@ def preprocess_image(input_path_or_url: str, max_side_size: int = 512, force_dow
 
                         window = rasterio.windows.from_bounds(iw, is_, ie, in_, transform=ds.transform)
                         window = window.round_offsets().round_lengths()
-                        arr = ds.read(window=window)
+                        arr = _read_tiff_hwc(ds, window=window)
                     else:
-                        arr = ds.read()
+                        arr = _read_tiff_hwc(ds)
             except Exception as e:
                 raise RuntimeError(f"Failed to open GeoTIFF at path '{tiff_path}': {e}")
 
@@ -114,7 +295,7 @@ def preprocess_image(input_path_or_url: str, max_side_size: int = 512, force_dow
             # Non-tiff URL -> fallback to PIL-based loader which may stream into memory
             if force_download:
                 try:
-                    img = Image.open(local_filename)
+                    arr = _load_rgb_array(local_filename)
                 except Exception as e:
                     raise RuntimeError(f"Failed to open downloaded image '{local_filename}': {e}") from e
             else:
@@ -129,23 +310,18 @@ def preprocess_image(input_path_or_url: str, max_side_size: int = 512, force_dow
         is_tiff = ext in ('.tif', '.tiff')
         if is_tiff:
             with rasterio.open(input_path_or_url) as ds:
-                arr = ds.read()
+                arr = _read_tiff_hwc(ds)
         else:
-            img = Image.open(input_path_or_url)
+            arr = _load_rgb_array(input_path_or_url)
 
-    # At this point either `img` (Pillow Image) is defined, or `arr` (numpy from rasterio) is defined.
-    # Convert Pillow image to numpy when needed
-    if 'img' in locals():
-        if Image is None:
-            raise RuntimeError('Pillow is required to open images')
-        arr = np.array(img)
-        # delte img to free memory
-        del img
+    # At this point `arr` is a numpy array, either HWC (image decoder) or CHW (rasterio).
 
     # If rasterio produced an array, it will be in CHW ordering (bands, rows, cols). Convert to HWC
     if arr.ndim == 3 and arr.shape[2] not in (1, 3, 4) and arr.shape[0] in (1, 2, 3, 4):
-        # assume CHW -> transpose
-        arr = np.transpose(arr, (1, 2, 0))
+        # assume CHW: drop unused bands while still cheap (band-major slicing is
+        # a view), then transpose and materialize HWC in a single strided copy
+        nkeep = min(3, arr.shape[0])
+        arr = np.ascontiguousarray(arr[:nkeep].transpose(1, 2, 0))
 
     h, w = arr.shape[0], arr.shape[1]
     nbands = arr.shape[2]
@@ -176,22 +352,23 @@ def preprocess_image(input_path_or_url: str, max_side_size: int = 512, force_dow
             scaled = np.zeros_like(band, dtype=np.uint8)
         else:
             scaled = ((band - mn) / (mx - mn) * 255.0).clip(0, 255).astype(np.uint8)
-        rgb = np.stack([scaled, scaled, scaled], axis=2)
+        # Broadcast the single band across three channels: one contiguous
+        # materialization instead of three stacked copies
+        rgb = np.ascontiguousarray(np.broadcast_to(scaled[..., None], scaled.shape + (3,)))
     elif nbands == 3 or nbands == 4:
         # Use only first three bands for 4-band images
-        rgb = arr[:, :, :3].astype(np.int16)
-        # delete arr to free memory
-        del arr
-        # Rescale per-channel to 0-255 if needed (e.g., 16-bit input)
-        out = np.zeros_like(rgb, dtype=np.uint8)
-        for c in range(3):
-            ch = rgb[:, :, c]
-            mn, mx = np.nanmin(ch), np.nanmax(ch)
-            if mx == mn:
-                out[:, :, c] = np.zeros_like(ch, dtype=np.uint8)
-            else:
-                out[:, :, c] = ((ch - mn) / (mx - mn) * 255.0).clip(0, 255).astype(np.uint8)
-        rgb = out
+        if arr.dtype == np.uint8:
+            # Common PNG/JPEG path: already 8-bit, no rescaling (or copy) needed
+            rgb = arr[:, :, :3]
+        else:
+            # Rescale all channels to 0-255 in one vectorized float32 pass
+            # (e.g., 16-bit input); float32 halves bandwidth vs float64
+            rgb32 = arr[:, :, :3].astype(np.float32, copy=False)
+            del arr
+            mn = np.nanmin(rgb32, axis=(0, 1))
+            mx = np.nanmax(rgb32, axis=(0, 1))
+            scale = np.where(mx > mn, 255.0 / (mx - mn), 0.0).astype(np.float32)
+            rgb = np.clip((rgb32 - mn) * scale, 0, 255).astype(np.uint8)
     else:
         raise RuntimeError(f'Unexpected image array shape encountered: {arr.shape}')
 
@@ -203,6 +380,14 @@ def preprocess_image(input_path_or_url: str, max_side_size: int = 512, force_dow
     if max_side_size <= 0:
         raise ValueError('max_side_size must be positive')
 
+    # Fast path: the whole image fits in one chip, so skip the padding
+    # allocation and tiling machinery and use the image itself
+    if w <= max_side_size and h <= max_side_size:
+        chips_arr = rgb[None, ...]
+        chips = [rgb]
+        chip_boxes = [(0, 0, w, h)]
+        return _build_preprocess_result(chips, chips_arr, chip_boxes, (w, h), (w, h), temp_dir, downloaded_path, as_tensor)
+
     # Number of tiles along each axis
     nx = 1 if w <= max_side_size else math.ceil(w / max_side_size)
     ny = 1 if h <= max_side_size else math.ceil(h / max_side_size)
@@ -226,69 +411,235 @@ def preprocess_image(input_path_or_url: str, max_side_size: int = 512, force_dow
     else:
         padded = rgb
 
-    chips = []
-    chip_boxes = []
-
-    for iy in range(ny):
-        for ix in range(nx):
-            x0 = ix * tile_w
-            y0 = iy * tile_h
-            x1 = x0 + tile_w
-            y1 = y0 + tile_h
-            chip = padded[y0:y1, x0:x1, :].copy()
-            # The chip_box should be expressed in ORIGINAL image coordinates (clipped to original dimensions)
-            box_x0 = x0
-            box_y0 = y0
-            box_x1 = min(x1, w)
-            box_y1 = min(y1, h)
-            chips.append(chip)
-            chip_boxes.append((box_x0, box_y0, box_x1, box_y1))
-
-    result = {
-        'chips': chips,
+    # Extract all chips with a single reshape/swapaxes instead of a Python
+    # slice-and-copy loop; the resulting chips are views into one array.
+    chips_arr = padded.reshape(ny, tile_h, nx, tile_w, 3).swapaxes(1, 2).reshape(ny * nx, tile_h, tile_w, 3)
+    chips = [chips_arr[i] for i in range(ny * nx)]
+
+    # chip_boxes are expressed in ORIGINAL image coordinates (clipped to original dimensions)
+    chip_boxes = [
+        (ix * tile_w, iy * tile_h, min((ix + 1) * tile_w, w), min((iy + 1) * tile_h, h))
+        for iy in range(ny)
+        for ix in range(nx)
+    ]
+
+    return _build_preprocess_result(chips, chips_arr, chip_boxes, (w, h), (padded_w, padded_h), temp_dir, downloaded_path, as_tensor)
+
+
+def preprocess_image_gpu(input_path_or_url: str, max_side_size: int = 512) -> Dict:
+    """Decode and chip a JPEG/PNG on the GPU, bypassing the CPU pixel path.
+
+    Downloads (or reads) the encoded bytes, decodes them with torchvision --
+    JPEGs go through nvJPEG directly on the CUDA device -- pads on-device and
+    cuts the chip grid with unfold, so the (N,3,tile_h,tile_w) uint8 batch
+    tensor is produced in one allocation with at most one host-to-device copy.
+
+    Returns a dict shaped like `preprocess_image`'s, with 'chips_tensor'
+    already resident on the GPU (feed it straight to `inference.run`) and
+    'chips' set to None since no host-side pixel arrays exist on this path.
+
+    Requires torch + torchvision and a CUDA device; raises RuntimeError
+    otherwise. GeoTIFFs are not supported here -- use `preprocess_image`.
+    """
+    try:
+        import torch
+        from torchvision.io import decode_image, decode_jpeg
+    except ImportError as e:
+        raise RuntimeError('preprocess_image_gpu requires torch and torchvision') from e
+    if not torch.cuda.is_available():
+        raise RuntimeError('preprocess_image_gpu requires a CUDA device')
+
+    if is_url(input_path_or_url):
+        path = urllib.request.urlparse(input_path_or_url).path
+        resp = _get_http_session().get(input_path_or_url, timeout=15)
+        resp.raise_for_status()
+        raw = resp.content
+    else:
+        path = input_path_or_url
+        with open(input_path_or_url, 'rb') as f:
+            raw = f.read()
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.tif', '.tiff'):
+        raise RuntimeError('preprocess_image_gpu does not handle GeoTIFF; use preprocess_image')
+
+    data = torch.frombuffer(bytearray(raw), dtype=torch.uint8)
+    if ext in ('.jpg', '.jpeg'):
+        # nvJPEG decodes directly into device memory
+        img = decode_jpeg(data, device='cuda')
+    else:
+        img = decode_image(data).to('cuda', non_blocking=True)
+
+    if img.shape[0] == 1:
+        img = img.expand(3, -1, -1)
+    elif img.shape[0] > 3:
+        img = img[:3]
+
+    h, w = img.shape[1], img.shape[2]
+    nx = 1 if w <= max_side_size else math.ceil(w / max_side_size)
+    ny = 1 if h <= max_side_size else math.ceil(h / max_side_size)
+    tile_w = min(math.ceil(w / nx), max_side_size)
+    tile_h = min(math.ceil(h / ny), max_side_size)
+    padded_w = tile_w * nx
+    padded_h = tile_h * ny
+
+    if padded_w != w or padded_h != h:
+        padded = torch.zeros((3, padded_h, padded_w), dtype=torch.uint8, device=img.device)
+        padded[:, :h, :w] = img
+    else:
+        padded = img
+
+    # unfold slices the chip grid as views; one permute+reshape materializes
+    # the contiguous batch tensor
+    chips_tensor = (
+        padded.unfold(1, tile_h, tile_h)
+        .unfold(2, tile_w, tile_w)
+        .permute(1, 2, 0, 3, 4)
+        .reshape(ny * nx, 3, tile_h, tile_w)
+        .contiguous()
+    )
+
+    chip_boxes = [
+        (ix * tile_w, iy * tile_h, min((ix + 1) * tile_w, w), min((iy + 1) * tile_h, h))
+        for iy in range(ny)
+        for ix in range(nx)
+    ]
+
+    return {
+        'chips': None,
         'chip_boxes': chip_boxes,
         'original_size': (w, h),
         'padded_size': (padded_w, padded_h),
-        'temp_dir': temp_dir,
-        'downloaded_path': downloaded_path,
+        'temp_dir': None,
+        'downloaded_path': None,
+        'chips_tensor': chips_tensor,
     }
-    return result
+
+
+def preprocess_images(inputs: List[str], max_workers: int = 8, **kwargs) -> List[Dict]:
+    """Preprocess several inputs (paths or URLs) concurrently.
+
+    Downloads and decodes overlap across a thread pool, hiding network
+    round-trips behind CPU decode work. Keyword arguments are forwarded to
+    `preprocess_image`. Results are returned in input order.
+    """
+    if not inputs:
+        return []
+    workers = min(max_workers, len(inputs))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda inp: preprocess_image(inp, **kwargs), inputs))
+
+
+def pad_chips_to_batch(chips: List[np.ndarray]) -> np.ndarray:
+    """Pack mixed-size chips into one (N, max_h, max_w, 3) uint8 batch array.
+
+    Chips are written into the top-left corner of their slot with zero padding
+    on the right/bottom, so detection coordinates on a padded chip are still
+    valid chip-local coordinates. This lets ragged chip sets (e.g. border
+    chips) go through a single batched forward pass instead of per-chip
+    dispatch.
+    """
+    max_h = max(c.shape[0] for c in chips)
+    max_w = max(c.shape[1] for c in chips)
+    batch = np.zeros((len(chips), max_h, max_w, 3), dtype=np.uint8)
+    for i, chip in enumerate(chips):
+        batch[i, :chip.shape[0], :chip.shape[1], :] = chip
+    return batch
+
+
+def _make_text_measurer(draw, font):
+    """Pick the label-measurement API once instead of probing per detection.
+
+    Prefers the modern `textbbox` (`textsize` is deprecated and removed in
+    Pillow 10); falls back to a zero size when neither API exists.
+    """
+    if hasattr(draw, 'textbbox'):
+        def measure(label):
+            x0, y0, x1, y1 = draw.textbbox((0, 0), label, font=font)
+            return (x1 - x0, y1 - y0)
+        return measure
+    if hasattr(draw, 'textsize'):
+        return lambda label: draw.textsize(label, font=font)
+    return lambda label: (0, 0)
 
 
 # Helpers for NMS and IoU
 
-def _compute_iou(box_a, box_b):
-    ax1, ay1, ax2, ay2 = box_a
-    bx1, by1, bx2, by2 = box_b
-    inter_x1 = max(ax1, bx1)
-    inter_y1 = max(ay1, by1)
-    inter_x2 = min(ax2, bx2)
-    inter_y2 = min(ay2, by2)
-    inter_w = max(0.0, inter_x2 - inter_x1)
-    inter_h = max(0.0, inter_y2 - inter_y1)
-    inter_area = inter_w * inter_h
-    area_a = max(0.0, ax2 - ax1) * max(0.0, ay2 - ay1)
-    area_b = max(0.0, bx2 - bx1) * max(0.0, by2 - by1)
-    union = area_a + area_b - inter_area
-    if union <= 0:
-        return 0.0
-    return inter_area / union
+if numba is not None:
+    @numba.njit(cache=True, fastmath=True)
+    def _nms_kernel(b, scores, iou_threshold):  # pragma: no cover - compiled
+        n = b.shape[0]
+        order = np.argsort(scores)[::-1]
+        suppressed = np.zeros(n, dtype=np.bool_)
+        keep = np.empty(n, dtype=np.int64)
+        nkeep = 0
+        for oi in range(n):
+            i = order[oi]
+            if suppressed[i]:
+                continue
+            keep[nkeep] = i
+            nkeep += 1
+            ax1, ay1, ax2, ay2 = b[i, 0], b[i, 1], b[i, 2], b[i, 3]
+            area_i = max(0.0, ax2 - ax1) * max(0.0, ay2 - ay1)
+            for oj in range(oi + 1, n):
+                j = order[oj]
+                if suppressed[j]:
+                    continue
+                xx1 = max(ax1, b[j, 0])
+                yy1 = max(ay1, b[j, 1])
+                xx2 = min(ax2, b[j, 2])
+                yy2 = min(ay2, b[j, 3])
+                inter = max(0.0, xx2 - xx1) * max(0.0, yy2 - yy1)
+                area_j = max(0.0, b[j, 2] - b[j, 0]) * max(0.0, b[j, 3] - b[j, 1])
+                union = area_i + area_j - inter
+                if union > 0 and inter / union > iou_threshold:
+                    suppressed[j] = True
+        return keep[:nkeep]
 
 
 def _nms_boxes(boxes, scores, iou_threshold=0.5):
+    """Greedy non-maximum suppression.
+
+    Picks the fastest available backend: torchvision's fused C++/CUDA nms
+    kernel first (torchvision ships alongside ultralytics, so this is the
+    path real deployments take); then the Numba-compiled kernel (native
+    pairwise loop with early-out on suppressed boxes, cached after first
+    JIT); finally a pure-NumPy implementation where each round keeps the
+    highest-scoring remaining box and computes its IoU against all other
+    remaining boxes in one array operation, so the Python loop runs once per
+    *kept* box rather than once per pair.
+    Returns the indices of kept boxes.
+    """
     if len(boxes) == 0:
         return []
-    idxs = list(range(len(boxes)))
-    idxs.sort(key=lambda i: scores[i], reverse=True)
+    b = np.asarray(boxes, dtype=np.float32)
+    scores = np.asarray(scores, dtype=np.float32)
+
+    if _torchvision_nms is not None:
+        # Single fused kernel launch over the whole box set
+        keep = _torchvision_nms(_torch.from_numpy(b), _torch.from_numpy(scores), float(iou_threshold))
+        return [int(i) for i in keep.tolist()]
+
+    if numba is not None:
+        return [int(i) for i in _nms_kernel(b, scores, np.float32(iou_threshold))]
+    areas = np.maximum(0.0, b[:, 2] - b[:, 0]) * np.maximum(0.0, b[:, 3] - b[:, 1])
+    order = np.argsort(scores)[::-1]
+
     keep = []
-    while idxs:
-        i = idxs.pop(0)
-        keep.append(i)
-        remove = []
-        for j in idxs:
-            if _compute_iou(boxes[i], boxes[j]) > iou_threshold:
-                remove.append(j)
-        idxs = [x for x in idxs if x not in remove]
+    while order.size > 0:
+        i = order[0]
+        keep.append(int(i))
+        if order.size == 1:
+            break
+        rest = order[1:]
+        xx1 = np.maximum(b[i, 0], b[rest, 0])
+        yy1 = np.maximum(b[i, 1], b[rest, 1])
+        xx2 = np.minimum(b[i, 2], b[rest, 2])
+        yy2 = np.minimum(b[i, 3], b[rest, 3])
+        inter = np.maximum(0.0, xx2 - xx1) * np.maximum(0.0, yy2 - yy1)
+        union = areas[i] + areas[rest] - inter
+        iou = np.where(union > 0, inter / union, 0.0)
+        order = rest[iou <= iou_threshold]
     return keep
 
 
@@ -300,74 +651,74 @@ def postprocess_detections(all_detections: List[Dict], chips: List[np.ndarray],
     w, h = original_size[0], original_size[1]
     padded_w, padded_h = padded_size
 
-    # Map detections into global coordinates
-    mapped = []
-    for det in all_detections:
-        det_copy = det.copy()
-        if 'xyxy' in det and '_chip_box' in det:
-            x0_off, y0_off, _, _ = det['_chip_box']
-            x1, y1, x2, y2 = det['xyxy']
-            gx1 = float(x1) + float(x0_off)
-            gy1 = float(y1) + float(y0_off)
-            gx2 = float(x2) + float(x0_off)
-            gy2 = float(y2) + float(y0_off)
-            gx1 = max(0.0, min(gx1, w))
-            gy1 = max(0.0, min(gy1, h))
-            gx2 = max(0.0, min(gx2, w))
-            gy2 = max(0.0, min(gy2, h))
-            det_copy['xyxy_global'] = (gx1, gy1, gx2, gy2)
-            mapped.append(det_copy)
-        else:
-            mapped.append(det_copy)
-
-    # Run NMS per class (name)
+    # Map detections into global coordinates: stack all chip-local boxes and
+    # chip origins once, then translate and clip with one broadcast add
+    # instead of per-detection Python arithmetic
+    mapped = [det.copy() for det in all_detections]
+    translatable = [i for i, det in enumerate(all_detections) if 'xyxy' in det and '_chip_box' in det]
+    if translatable:
+        local = np.array([all_detections[i]['xyxy'] for i in translatable], dtype=np.float32)
+        offsets = np.array(
+            [(all_detections[i]['_chip_box'][0], all_detections[i]['_chip_box'][1]) * 2 for i in translatable],
+            dtype=np.float32,
+        )
+        global_boxes = local + offsets
+        np.clip(global_boxes[:, 0::2], 0.0, w, out=global_boxes[:, 0::2])
+        np.clip(global_boxes[:, 1::2], 0.0, h, out=global_boxes[:, 1::2])
+        for row, i in enumerate(translatable):
+            mapped[i]['xyxy_global'] = tuple(map(float, global_boxes[row]))
+
+    # Run NMS per class (name): stack all boxes once, group classes by a single
+    # stable argsort and run NMS on each contiguous class slice, instead of
+    # re-bucketing through dicts and sets in several Python passes
     final = []
-    by_name = {}
-    for idx, d in enumerate(mapped):
+    global_idx = np.array([i for i, d in enumerate(mapped) if 'xyxy_global' in d], dtype=np.int64)
+    kept_mask = np.zeros(len(mapped), dtype=bool)
+    if global_idx.size:
+        names = np.array([mapped[i]['name'] for i in global_idx])
+        boxes = np.array([mapped[i]['xyxy_global'] for i in global_idx], dtype=np.float32)
+        scores = np.array([mapped[i]['confidence'] for i in global_idx], dtype=np.float32)
+        order = np.argsort(names, kind='stable')
+        sorted_names = names[order]
+        split_points = np.nonzero(sorted_names[1:] != sorted_names[:-1])[0] + 1
+        for cls_slice in np.split(order, split_points):
+            keep = _nms_boxes(boxes[cls_slice], scores[cls_slice], iou_threshold=nms_iou)
+            kept_mask[global_idx[cls_slice[keep]]] = True
+
+    for i, d in enumerate(mapped):
         if 'xyxy_global' in d:
-            by_name.setdefault(d['name'], []).append(idx)
-
-    kept_indices = set()
-    for name, indices in by_name.items():
-        boxes = [mapped[i]['xyxy_global'] for i in indices]
-        scores = [mapped[i]['confidence'] for i in indices]
-        keep = _nms_boxes(boxes, scores, iou_threshold=nms_iou)
-        for k in keep:
-            kept_indices.add(indices[k])
-
-    for i in range(len(mapped)):
-        if 'xyxy_global' in mapped[i]:
-            if i in kept_indices:
+            if kept_mask[i]:
                 final.append({
-                    'name': mapped[i]['name'],
-                    'confidence': mapped[i]['confidence'],
-                    'xyxy': mapped[i]['xyxy_global']
+                    'name': d['name'],
+                    'confidence': d['confidence'],
+                    'xyxy': d['xyxy_global']
                 })
         else:
-            final.append(mapped[i])
-
-    # Reconstruct full-size RGB image from chips
-    full_padded = np.zeros((padded_h, padded_w, 3), dtype=np.uint8)
-    for idx, chip in enumerate(chips):
-        x0, y0, x1, y1 = chip_boxes[idx]
-        ch_h, ch_w = chip.shape[0], chip.shape[1]
-        px0 = int(x0)
-        py0 = int(y0)
-        px1 = px0 + ch_w
-        py1 = py0 + ch_h
-        full_padded[py0:py1, px0:px1, :] = chip
-
-    full_rgb = full_padded[0:h, 0:w, :]
-
-    # Annotate full-size image if requested
+            final.append(d)
+
+    # Annotate full-size image if requested. The full-size image is only
+    # reconstructed from chips when actually needed; otherwise we skip the
+    # O(W*H) allocation and copy entirely.
     if output_path is not None and Image is not None and ImageDraw is not None:
         try:
+            full_padded = np.zeros((padded_h, padded_w, 3), dtype=np.uint8)
+            for idx, chip in enumerate(chips):
+                x0, y0, x1, y1 = chip_boxes[idx]
+                ch_h, ch_w = chip.shape[0], chip.shape[1]
+                px0 = int(x0)
+                py0 = int(y0)
+                px1 = px0 + ch_w
+                py1 = py0 + ch_h
+                full_padded[py0:py1, px0:px1, :] = chip
+
+            full_rgb = full_padded[0:h, 0:w, :]
             img = Image.fromarray(full_rgb.astype('uint8'), 'RGB')
             draw = ImageDraw.Draw(img)
             try:
                 font = ImageFont.load_default()
             except Exception:
                 font = None
+            measure = _make_text_measurer(draw, font)
 
             for d in final:
                 if 'xyxy' not in d:
@@ -375,10 +726,7 @@ def postprocess_detections(all_detections: List[Dict], chips: List[np.ndarray],
                 x1, y1, x2, y2 = map(int, d['xyxy'])
                 label = f"{d['name']} {d['confidence']:.2f}"
                 draw.rectangle([x1, y1, x2, y2], outline='red', width=3)
-                try:
-                    text_size = draw.textsize(label, font=font) if hasattr(draw, 'textsize') else (0, 0)
-                except Exception:
-                    text_size = (0, 0)
+                text_size = measure(label)
                 text_bg = [x1, max(y1 - text_size[1] - 4, 0), x1 + text_size[0] + 4, y1]
                 draw.rectangle(text_bg, fill='red')
                 draw.text((x1 + 2, max(y1 - text_size[1] - 3, 0)), label, fill='white', font=font)
@@ -395,22 +743,24 @@ def postprocess_detections(all_detections: List[Dict], chips: List[np.ndarray],
             if '_chip_index' in d and 'xyxy' in d:
                 idx = d['_chip_index']
                 per_chip.setdefault(idx, []).append(d)
+        try:
+            chip_font = ImageFont.load_default()
+        except Exception:
+            chip_font = None
         for idx, dets in per_chip.items():
             try:
                 chip = chips[idx]
                 img_chip = Image.fromarray(chip.astype('uint8'), 'RGB')
                 draw = ImageDraw.Draw(img_chip)
+                measure = _make_text_measurer(draw, chip_font)
                 for d in dets:
                     x1, y1, x2, y2 = map(int, d['xyxy'])
                     label = f"{d['name']} {d['confidence']:.2f}"
                     draw.rectangle([x1, y1, x2, y2], outline='red', width=2)
-                    try:
-                        text_size = draw.textsize(label, font=font) if hasattr(draw, 'textsize') else (0, 0)
-                    except Exception:
-                        text_size = (0, 0)
+                    text_size = measure(label)
                     text_bg = [x1, max(y1 - text_size[1] - 4, 0), x1 + text_size[0] + 4, y1]
                     draw.rectangle(text_bg, fill='red')
-                    draw.text((x1 + 2, max(y1 - text_size[1] - 3, 0)), label, fill='white', font=font)
+                    draw.text((x1 + 2, max(y1 - text_size[1] - 3, 0)), label, fill='white', font=chip_font)
                 outpath = f"chip_{idx+1}_annotated.png"
                 img_chip.save(outpath)
                 print(f"Saved annotated chip: {outpath}")
@@ -1,12 +1,43 @@
 from typing import Optional
 import argparse
+import multiprocessing
 import sys
 import os
 import shutil
 
-# Local package imports (after restructure)
-from inference import run as run_inference
-import processors
+# Local package imports (after restructure); fall back to bare imports when
+# executed as a script from inside src/
+try:
+    from src.inference import run as run_inference
+    from src import processors
+except ImportError:
+    from inference import run as run_inference
+    import processors
+
+
+# Per-worker state for multi-device inference (set by _pool_init in each worker)
+_worker_weights = None
+_worker_confidence = 0.0
+
+
+def _pool_init(devices, weights, confidence):
+    """Pool initializer: pin this worker to one device, round-robin by worker slot.
+
+    Each worker then lazily loads its own model (via inference's per-process
+    cache) on its assigned device.
+    """
+    global _worker_weights, _worker_confidence
+    identity = multiprocessing.current_process()._identity
+    slot = (identity[0] - 1) if identity else 0
+    os.environ['CUDA_VISIBLE_DEVICES'] = devices[slot % len(devices)]
+    _worker_weights = weights
+    _worker_confidence = confidence
+
+
+def _pool_predict(item):
+    idx, chip = item
+    detections = run_inference(weights=_worker_weights, image_input=chip, confidence_threshold=_worker_confidence)
+    return idx, detections
 
 
 def parse_args(argv=None):
@@ -16,6 +47,8 @@ def parse_args(argv=None):
     parser.add_argument('--output', type=str, default=None, help='Optional path to save annotated image (full-size annotation will be done by post-processor)')
     parser.add_argument('--confidence', '--threshold', '-t', type=float, dest='confidence', default=0.0, help='Confidence threshold: discard detections with confidence less than this value (default 0.0)')
     parser.add_argument('--force-download', action='store_true', help='Force download of image when input is a URL (store in a temporary folder)')
+    parser.add_argument('--batch-size', type=int, default=16, help='Number of chips sent to the model per forward pass (default 16)')
+    parser.add_argument('--devices', type=str, default=None, help="Comma-separated CUDA device ids (e.g. '0,1,2,3'); when more than one is given, chips are dispatched to one worker process per device")
     parser.add_argument('--max-side-size', type=int, default=512, help='Maximum side size (pixels) for chips produced by the preprocessor (default 512)')
     parser.add_argument('--downsample-factor', '-d', type=int, dest='downsample_factor', default=1.0, help='Factor to downsample the image before processing (default 1.0 = no downsampling)')
     parser.add_argument('--annotate-chips', action='store_true', help='(Optional) annotate individual chips as they are processed; defaults to False. Full-size annotation is performed by post-processor.')
@@ -55,14 +88,31 @@ def main(argv=None) -> int:
 
     all_detections = []
 
-    # Run inference sequentially on each chip
-    for idx, chip in enumerate(chips):
-        print(f"Processing chip {idx + 1}/{len(chips)} at original position {chip_boxes[idx]}")
-        detections = run_inference(weights=args.weights, image_input=chip, confidence_threshold=args.confidence)
-        for det in detections:
-            det['_chip_index'] = idx
-            det['_chip_box'] = chip_boxes[idx]
-        all_detections.extend(detections)
+    devices = [d.strip() for d in args.devices.split(',') if d.strip()] if args.devices else []
+    if len(devices) > 1:
+        # Chips are data-parallel until post-processing: fan them out across one
+        # worker process per device, each with its own pinned model instance
+        print(f"Dispatching {len(chips)} chips across devices: {', '.join(devices)}")
+        with multiprocessing.Pool(processes=len(devices), initializer=_pool_init, initargs=(devices, args.weights, args.confidence)) as pool:
+            for idx, detections in pool.imap_unordered(_pool_predict, enumerate(chips)):
+                for det in detections:
+                    det['_chip_index'] = idx
+                    det['_chip_box'] = chip_boxes[idx]
+                all_detections.extend(detections)
+    else:
+        # Run inference on chips in batches so the model sees one stacked tensor
+        # per batch instead of paying full per-call overhead for every chip
+        batch_size = max(1, args.batch_size)
+        for start in range(0, len(chips), batch_size):
+            batch = chips[start:start + batch_size]
+            print(f"Processing chips {start + 1}-{start + len(batch)}/{len(chips)}")
+            batch_detections = run_inference(weights=args.weights, image_input=batch, confidence_threshold=args.confidence)
+            for offset, detections in enumerate(batch_detections):
+                idx = start + offset
+                for det in detections:
+                    det['_chip_index'] = idx
+                    det['_chip_box'] = chip_boxes[idx]
+                all_detections.extend(detections)
 
     # Post-process detections: aggregate, NMS, annotate full image, optionally annotate chips
     aggregated = processors.postprocess_detections(all_detections, chips, chip_boxes, pre['original_size'], pre['padded_size'], annotate_chips=args.annotate_chips, output_path=args.output)
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# set the path to one folder level above this file's location
+sys.path.append(str(Path(__file__).parent.parent))
+
+# The auth module pulls in the MCP/Starlette server stack at import time
+pytest.importorskip("starlette", reason="starlette not installed")
+pytest.importorskip("mcp", reason="mcp not installed")
+
+# Ensure AuthConfig picks up a known key instead of generating a dev one
+os.environ.setdefault("ENV", "local")
+os.environ.setdefault("MCP_API_KEY", "test-api-key")
+
+from src.mcp_server import auth  # noqa: E402
+
+API_KEY = auth.auth_config.api_key
+
+
+class _RecordingApp:
+    """Downstream ASGI app stub that records whether it was reached."""
+
+    def __init__(self):
+        self.called = False
+
+    async def __call__(self, scope, receive, send):
+        self.called = True
+
+
+def _scope(path='/mcp', headers=(), scope_type='http'):
+    return {'type': scope_type, 'path': path, 'headers': list(headers)}
+
+
+def _call_middleware(scope):
+    """Run the middleware against a fake scope; return (app, sent messages)."""
+    app = _RecordingApp()
+    middleware = auth.APIKeyAuthMiddleware(app)
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request'}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    return app, sent
+
+
+def _response_status(sent):
+    starts = [m for m in sent if m['type'] == 'http.response.start']
+    assert starts, "Middleware did not send a response"
+    return starts[0]['status']
+
+
+def test_missing_header_rejected():
+    """A protected path without any credential header gets a 401."""
+    app, sent = _call_middleware(_scope())
+    assert not app.called
+    assert _response_status(sent) == 401
+
+
+def test_invalid_bearer_key_rejected():
+    """A wrong API key in the Authorization header gets a 401."""
+    headers = [(b'authorization', b'Bearer not-the-key')]
+    app, sent = _call_middleware(_scope(headers=headers))
+    assert not app.called
+    assert _response_status(sent) == 401
+
+
+def test_empty_bearer_token_rejected():
+    """'Authorization: Bearer ' with no token is treated as missing."""
+    headers = [(b'authorization', b'Bearer ')]
+    app, sent = _call_middleware(_scope(headers=headers))
+    assert not app.called
+    assert _response_status(sent) == 401
+
+
+def test_valid_bearer_passes_through():
+    """A valid Authorization: Bearer key reaches the downstream app."""
+    headers = [(b'authorization', b'Bearer ' + API_KEY.encode())]
+    app, sent = _call_middleware(_scope(headers=headers))
+    assert app.called
+    assert sent == []
+
+
+def test_valid_x_api_key_passes_through():
+    """A valid X-API-Key header reaches the downstream app."""
+    headers = [(b'x-api-key', API_KEY.encode())]
+    app, sent = _call_middleware(_scope(headers=headers))
+    assert app.called
+    assert sent == []
+
+
+def test_authorization_takes_priority_over_x_api_key():
+    """A bad Bearer token is rejected even when a valid X-API-Key is present."""
+    headers = [
+        (b'authorization', b'Bearer not-the-key'),
+        (b'x-api-key', API_KEY.encode()),
+    ]
+    app, sent = _call_middleware(_scope(headers=headers))
+    assert not app.called
+    assert _response_status(sent) == 401
+
+
+def test_unprotected_path_untouched():
+    """Paths outside the protected prefix pass through with no credentials."""
+    app, sent = _call_middleware(_scope(path='/health'))
+    assert app.called
+    assert sent == []
+
+
+def test_non_http_scope_untouched():
+    """Non-http scopes (e.g. lifespan) are forwarded without inspection."""
+    app, sent = _call_middleware({'type': 'lifespan'})
+    assert app.called
+    assert sent == []
+
+
+def test_extract_token_bearer_case_insensitive():
+    """The Bearer scheme matches regardless of case and strips whitespace."""
+    scope = _scope(headers=[(b'authorization', b'bearer  spaced-token ')])
+    assert auth._extract_token_from_scope(scope) == b'spaced-token'
+
+
+def test_extract_token_prefers_authorization():
+    """Authorization wins over X-API-Key when both are present."""
+    scope = _scope(headers=[
+        (b'x-api-key', b'key-from-x-api-key'),
+        (b'authorization', b'Bearer key-from-authorization'),
+    ])
+    assert auth._extract_token_from_scope(scope) == b'key-from-authorization'
+
+
+def test_extract_token_falls_back_to_x_api_key():
+    """A non-Bearer Authorization header falls through to X-API-Key."""
+    scope = _scope(headers=[
+        (b'authorization', b'Basic dXNlcjpwYXNz'),
+        (b'x-api-key', b' padded-key '),
+    ])
+    assert auth._extract_token_from_scope(scope) == b'padded-key'
+
+
+def test_extract_token_missing_headers():
+    """No credential headers yields None."""
+    assert auth._extract_token_from_scope(_scope()) is None